@@ -1,21 +1,77 @@
-import requests
 import json
 import logging
 import time
-from bs4 import BeautifulSoup
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
-import matplotlib.pyplot as plt
+import sys
+import unicodedata
 import argparse
-from datetime import datetime
+from functools import cached_property, lru_cache
+from dataclasses import dataclass
+from collections import Counter, defaultdict
+
+# orjson is much faster than the standard json module, but stays optional.
+try:
+    import orjson
+
+    def json_loads(data):
+        return orjson.loads(data)
+
+    def json_dumps(obj, pretty=False):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+except ImportError:
+    def json_loads(data):
+        return json.loads(data)
+
+    def json_dumps(obj, pretty=False):
+        if pretty:
+            text = json.dumps(obj, indent=2, ensure_ascii=False)
+        else:
+            text = json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+        return text.encode("utf-8")
 
 USER_LIST_FILE_NAME = "users.json"
 USER_MONSTERS_FILE = "monsters.json"
+API_CACHE_FILE = "api_cache.json"
+# Layout of the monster index files, stored files of another version are rebuilt.
+MONSTER_INDEX_VERSION = 2
 REQUEST_DELAY = 1
+API_WORKERS = 8
+# Values of a set "propose"/"recherche" flag in the monster records of the API.
+FLAG_SET_VALUES = ("1", 1)
 
 # Minimal logging setup
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 logger = logging.getLogger(__name__)
 
+class RateLimiter:
+    """
+    Spaces out calls so that at most one call starts every `interval` seconds,
+    no matter how many threads are waiting on the limiter.
+
+    Only the part of the interval not already spent since the previous call is
+    slept: a call coming after a slow request doesn't wait at all.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_call = 0.0
+
+    def wait(self):
+        # Reserve the next free slot under the lock, then sleep outside of it.
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_call - now
+            self._next_call = max(now, self._next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+# Shared by every API call to stay under the API rate limit (60 calls/minute).
+api_rate_limiter = RateLimiter(REQUEST_DELAY)
+# Same for the requests made to the website itself.
+site_rate_limiter = RateLimiter(REQUEST_DELAY)
+
 def start_session():
     """
     Starts a requests.Session and logs into the website using credentials
@@ -42,6 +98,9 @@ def start_session():
         logger.error("Missing key in 'input.json': %s", e)
         raise
 
+    # Imported here: requests is slow to import and only needed by the commands using the network.
+    import requests
+
     # Create a session
     session = requests.Session()
 
@@ -54,6 +113,7 @@ def start_session():
 
     # Perform the login POST request
     try:
+        site_rate_limiter.wait()
         response = session.post(login_url, data=payload)
     except Exception as e:
         logger.error("An error occurred during the POST request: %s", e)
@@ -72,67 +132,138 @@ def start_session():
 
 def fetch_users_page(session):
     """
-    Uses an authenticated session to GET the user list page and returns its HTML content.
+    Uses an authenticated session to GET the user list page and returns a stream of its HTML
+    content, so that it can be parsed while it is downloaded.
     
     Args:
         session (requests.Session): The authenticated session object.
         
     Returns:
-        str: HTML content of the page containing the user list.
+        tuple: Binary stream of the HTML content of the page containing the user list,
+               to be closed by the caller, and its encoding (from the HTTP headers).
         None: If the request fails.
     """
     url = "https://www.metamob.fr/utilisateur"
     try:
-        response = session.get(url)
+        site_rate_limiter.wait()
+        response = session.get(url, stream=True)
     except Exception as e:
         logger.error("Error during GET request to %s: %s", url, e)
         return None
 
     if response.status_code == 200:
         logger.info("Successfully retrieved the users page.")
-        return response.text
+        # Let urllib3 decompress the body (gzip...) while it is read.
+        response.raw.decode_content = True
+        # The charset of the Content-Type header, the page may not declare it itself.
+        return response.raw, response.encoding or "utf-8"
     else:
         logger.error("Failed to retrieve the users page: Status code %s\nResponse: %s", response.status_code, response.text)
         return None
 
-def parse_user_names(html_content):
+def parse_user_names(html_stream, encoding="utf-8"):
     """
     Parse le contenu HTML de la page des utilisateurs pour en extraire la liste des noms d'utilisateurs.
+    Le contenu est parse au fil de la lecture, sans attendre la fin du telechargement.
     
     Args:
-        html_content (str): Le contenu HTML de la page des utilisateurs.
+        html_stream (file-like): Flux binaire du contenu HTML de la page des utilisateurs.
+        encoding (str): Encodage du contenu (celui annonce par les en-tetes HTTP).
     
     Returns:
         list: Une liste des noms d'utilisateurs extraits.
     """
-    soup = BeautifulSoup(html_content, "html.parser")
+    # Importe ici : lxml n'est utile qu'a la commande scrap_users.
+    from lxml import etree as lxml_etree
+
     user_names = []
 
     # Trouver toutes les balises <div> avec la classe "utilisateur-nom"
-    for nom_div in soup.find_all("div", class_="utilisateur-nom"):
+    for _, nom_div in lxml_etree.iterparse(html_stream, events=("end",), tag="div", html=True,
+                                             encoding=encoding):
+        if "utilisateur-nom" not in (nom_div.get("class") or "").split():
+            continue
         # Extraire le texte en retirant les espaces superflus
-        name = nom_div.get_text(strip=True)
+        name = "".join(nom_div.itertext()).strip()
         if name:
             user_names.append(name)
+        # Liberer le sous-arbre deja traite
+        nom_div.clear(keep_tail=True)
     return user_names
 
 def get_metamob_user_list():
     try:
         session = start_session()
-        time.sleep(REQUEST_DELAY)  # Respect the minimal delay after the request.
         # Further actions can be performed using the 'session' object.
-        users_html = fetch_users_page(session)
-        if users_html is None:
-            raise Exception("Failed to retrieve data from {}.".format(url))
+        users_page = fetch_users_page(session)
+        if users_page is None:
+            raise Exception("Failed to retrieve the users page.")
     except Exception as e:
         logger.error("Failed to start session: %s", e)
-    return parse_user_names(users_html)
+        return []
+    users_stream, encoding = users_page
+    # The page is downloaded while it is parsed: read errors show up here.
+    try:
+        with users_stream:
+            return parse_user_names(users_stream, encoding=encoding)
+    except Exception as e:
+        logger.error("Failed to read the users page: %s", e)
+        return []
+
+@lru_cache(maxsize=4)
+def _load_json_cached(file_name, mtime_ns, size):
+    # mtime_ns and size are only there to be part of the cache key.
+    with open(file_name, "rb") as f:
+        return json_loads(f.read())
+
+def load_json_file(file_name):
+    """
+    Loads a JSON file, reusing the already decoded content when the file
+    did not change since the last load (same modification time and size).
+
+    The returned object is shared between the calls: callers updating it
+    must write it back to the file.
+
+    Raises:
+        OSError: If the file cannot be read.
+        json.JSONDecodeError: If the file is not valid JSON.
+    """
+    stat = os.stat(file_name)
+    return _load_json_cached(file_name, stat.st_mtime_ns, stat.st_size)
+
+def write_json_file(data, file_name, pretty=False):
+    """
+    Writes data as JSON to the given file, compact unless pretty is True.
+
+    The content is serialized in memory and written in one go to a temporary
+    file, flushed to disk, which then replaces the target: an interrupted run
+    (or a crash of the machine) never leaves a half-written file behind.
+
+    Raises:
+        OSError: If the file cannot be written.
+    """
+    payload = json_dumps(data, pretty=pretty)
+    tmp_file = file_name + ".tmp"
+    # Binary mode: no TextIOWrapper re-encoding, and a 1 MiB buffer so that the
+    # payload goes out in as few write() calls as possible.
+    try:
+        with open(tmp_file, "wb", buffering=1 << 20) as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, file_name)
+    except BaseException:
+        # Don't leave the partial temporary file behind (disk full...).
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+        raise
 
 def get_local_users(file_name=USER_LIST_FILE_NAME):
     if os.path.exists(file_name):
         try:
-            with open(file_name, "r", encoding="utf-8") as f:
-                current_users = json.load(f)
+            current_users = load_json_file(file_name)
             # S'assurer que la structure est bien une liste
             if not isinstance(current_users, dict):
                 logger.warning("La structure du JSON dans '%s' n'est pas une liste. On la réinitialise.", file_name)
@@ -143,15 +274,14 @@ def get_local_users(file_name=USER_LIST_FILE_NAME):
         current_users = {}
     return current_users
 
-def scrap_user_list(output_file=USER_LIST_FILE_NAME):
+def scrap_user_list(output_file=USER_LIST_FILE_NAME, pretty=False):
     new_users = get_metamob_user_list()
     logger.info("%d utilisateurs ont été trouvés sur le site.", len(new_users))
     current_users = {}
     # Vérifier si le fichier existe et essayer de le charger
     if os.path.exists(output_file):
         try:
-            with open(output_file, "r", encoding="utf-8") as f:
-                current_users = json.load(f)
+            current_users = load_json_file(output_file)
             # S'assurer que la structure est bien une liste
             if not isinstance(current_users, dict):
                 logger.warning("The content of %s is not a dictionary. Reinitializing.", output_file)
@@ -172,16 +302,16 @@ def scrap_user_list(output_file=USER_LIST_FILE_NAME):
     # Sauvegarder uniquement si des mises à jour sont effectuées
     if added_users:
         try:
-            with open(output_file, "w", encoding="utf-8") as f:
-                json.dump(current_users, f, indent=4, ensure_ascii=False)
+            write_json_file(current_users, output_file, pretty=pretty)
             logger.info("Added new users: %s", added_users)
         except IOError as e:
             logger.error("Error writing to file %s: %s", output_file, e)
     else:
         logger.info("No new users to add.")
 
+@lru_cache(maxsize=1)
 def load_api_key():
-    # Load the API key from input.json
+    # Load the API key from input.json (cached: the file is only read once)
     try:
         with open("input.json", "r", encoding="utf-8") as f:
             data = json.load(f)
@@ -194,7 +324,93 @@ def load_api_key():
         logger.error("The key 'apikey' is missing in input.json.")
         return None
 
-def get_monsters_for_user(username, only_archi=True):
+@lru_cache(maxsize=1)
+def get_api_session():
+    """
+    Returns the requests.Session shared by all the API calls.
+
+    The session carries the API key as a default header and keeps its
+    connections alive, so consecutive calls to api.metamob.fr reuse the same
+    socket instead of paying a new TCP+TLS handshake each time.
+
+    Connection errors and transient error statuses (429, 5xx) are retried with an
+    exponential backoff, following the Retry-After header when the API sends one.
+    The retries go through api_rate_limiter too, so they don't exceed the API rate limit.
+
+    Returns:
+        requests.Session: The API session, or None if no API key is available.
+    """
+    api_key = load_api_key()
+    if not api_key:
+        return None
+    # Imported here: requests is slow to import and only needed by the commands using the network.
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    class RateLimitedRetry(Retry):
+        # A retry is an API call like any other: after the backoff, it also waits for
+        # its turn in api_rate_limiter (urllib3 retries the first time without delay).
+        def sleep(self, response=None):
+            super().sleep(response)
+            api_rate_limiter.wait()
+
+    session = requests.Session()
+    session.headers.update({"HTTP-X-APIKEY": api_key})
+    retry = RateLimitedRetry(total=5, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504),
+                             respect_retry_after_header=True, raise_on_status=False)
+    session.mount("https://", HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=64))
+    return session
+
+def load_api_cache(file_name=API_CACHE_FILE):
+    """
+    Loads the cache of the API responses, a dictionary mapping a cache key to the
+    validators ("etag", "last_modified") and the decoded "body" of the last response.
+    """
+    try:
+        api_cache = load_json_file(file_name)
+    except FileNotFoundError:
+        return {}
+    except (json.JSONDecodeError, IOError) as e:
+        logger.error("Error loading file %s: %s", file_name, e)
+        return {}
+    return api_cache if isinstance(api_cache, dict) else {}
+
+def store_api_cache(api_cache, file_name=API_CACHE_FILE):
+    # Don't create the file as long as the API sends no validators.
+    if not api_cache and not os.path.exists(file_name):
+        return
+    try:
+        write_json_file(api_cache, file_name)
+    except IOError as e:
+        logger.error("Error writing to file %s: %s", file_name, e)
+
+def conditional_headers(api_cache, cache_key):
+    """
+    Returns the headers asking the API to answer "304 Not Modified" if the
+    response cached under cache_key is still up to date.
+    """
+    entry = api_cache.get(cache_key) if api_cache is not None else None
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+def cache_response(api_cache, cache_key, response, body):
+    # Only responses carrying validators can be revalidated later on.
+    if api_cache is None:
+        return
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if etag or last_modified:
+        api_cache[cache_key] = {"etag": etag, "last_modified": last_modified, "body": body}
+    else:
+        api_cache.pop(cache_key, None)
+
+def get_monsters_for_user(username, only_archi=True, api_cache=None):
     """
     Retrieves the list of monsters for a given user (pseudo) by calling the API.
     
@@ -203,34 +419,40 @@ def get_monsters_for_user(username, only_archi=True):
     
     Args:
         username (str): The user's pseudo.
+        api_cache (dict): Optional cache of the API responses (see load_api_cache). An
+                          unchanged list of monsters is then not downloaded again.
         
     Returns:
         dict or list: The JSON decoded response containing the list of monsters, 
                       or None if the request fails.
     """
-    api_key = load_api_key()
-    if not api_key:
+    session = get_api_session()
+    if session is None:
         logger.error("No API key available. Aborting.")
         return
 
     # Construct the API URL
     url = f"https://api.metamob.fr/utilisateurs/{username}/monstres"
-    headers = {"HTTP-X-APIKEY": api_key}
+    # The cached body is the filtered list.
+    cache_key = f"{url}#archimonstre" if only_archi else url
 
     try:
-        response = requests.get(url, headers=headers)
-        # Optional: respect a minimal delay between API calls if needed.
-        time.sleep(REQUEST_DELAY)
+        api_rate_limiter.wait()
+        response = session.get(url, headers=conditional_headers(api_cache, cache_key))
     except Exception as e:
         logger.error("An error occurred during the API call: %s", e)
         return None
 
-    if response.status_code == 200:
+    if response.status_code == 304 and api_cache and cache_key in api_cache:
+        logger.info("Monsters unchanged for user: %s", username)
+        return api_cache[cache_key]["body"]
+    elif response.status_code == 200:
         logger.info("Successfully retrieved monsters for user: %s", username)
         try:
-            monsters = response.json()
+            monsters = json_loads(response.content)
             if only_archi:
                 monsters = [m for m in monsters if m["type"] == "archimonstre"]
+            cache_response(api_cache, cache_key, response, monsters)
             return monsters
         except json.JSONDecodeError:
             logger.error("Failed to decode JSON response for user: %s", username)
@@ -240,92 +462,262 @@ def get_monsters_for_user(username, only_archi=True):
                      response.status_code, response.text)
         return None
 
-def get_monsters_for_users(user_list, only_archi=True):
+def _run_pool(func, items, workers, **kwargs):
+    """
+    Calls func(item, **kwargs) for each item from a pool of `workers` threads, and
+    yields the (item, result) pairs as the calls complete.
+
+    On an exception in the caller (Ctrl-C...), the calls not started yet are
+    dropped instead of running every one of them before the error goes up.
+    """
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {executor.submit(func, item, **kwargs): item for item in items}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    except BaseException:
+        # Also reached when the caller stops iterating (GeneratorExit).
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+def get_monsters_for_users(user_list, only_archi=True, workers=API_WORKERS):
     """
     For each user in the given list, retrieves monster data by calling the API,
     aggregates the responses into one big JSON object, and stores it in a file.
+
+    The calls are issued from a pool of `workers` threads; the shared rate
+    limiter keeps the overall pace at one call every REQUEST_DELAY seconds, so
+    the network round-trips overlap instead of adding up.
     
     Args:
         user_list (list): List of user names (strings) for which to retrieve monsters.
+        workers (int): Number of concurrent API calls (default is API_WORKERS).
         
     Returns:
-        dict: A dictionary where each key is a username and its value is the corresponding monster data.
+        dict: A dictionary where each key is a username and its value is the corresponding monster data,
+              or None if no API key is available.
     """
-    aggregated_data = {}
+    # Checked once here rather than by every call of the pool.
+    if get_api_session() is None:
+        logger.error("No API key available. Aborting.")
+        return None
 
+    api_cache = load_api_cache()
     nb = len(user_list)
-    for i, user in enumerate(user_list):
-        logger.info("Processing user: %s - %d/%d", user, i+1, nb)
-        monster_data = get_monsters_for_user(user, only_archi=only_archi)
-        aggregated_data[user] = monster_data
+    results = {}
+    for i, (user, monsters) in enumerate(_run_pool(get_monsters_for_user, user_list, workers,
+                                                   only_archi=only_archi, api_cache=api_cache)):
+        results[user] = monsters
+        logger.info("Processed user: %s - %d/%d", user, i+1, nb)
+    store_api_cache(api_cache)
+
+    # Keep the users in their original order.
+    aggregated_data = {user: results[user] for user in user_list}
     return aggregated_data
 
-def store_monsters_for_users(aggregated_data, output_file=USER_MONSTERS_FILE):
-    # Save the aggregated data to the specified file.
+def store_monsters_for_users(aggregated_data, output_file=USER_MONSTERS_FILE, pretty=False):
+    # Save the aggregated data to the specified file, returns whether it was written.
     try:
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(aggregated_data, f, indent=4, ensure_ascii=False)
+        write_json_file(aggregated_data, output_file, pretty=pretty)
         logger.info("Aggregated monster data stored in %s", output_file)
+        return True
     except Exception as e:
         logger.error("Error writing aggregated data to file: %s", e)
+        return False
 
-def update_monsters_for_users(user_list=[], only_archi=True, output_file=USER_MONSTERS_FILE):
+def update_monsters_for_users(user_list=[], only_archi=True, output_file=USER_MONSTERS_FILE, pretty=False,
+                              workers=API_WORKERS):
     if len(user_list) == 0:
         user_list = get_local_users()
-    monsters = get_monsters_for_users(user_list, only_archi=only_archi)
-    store_monsters_for_users(monsters, output_file=output_file)
+    monsters = get_monsters_for_users(user_list, only_archi=only_archi, workers=workers)
+    if monsters is None:
+        return
+    if store_monsters_for_users(monsters, output_file=output_file, pretty=pretty):
+        store_monster_index(monsters, output_file)
+
+def intern_monster_names(aggregated_data):
+    """
+    Interns, in place, the monster name ("nom") of every record. The same names are
+    repeated by every player: once interned they share a single string object, which
+    saves memory and lets the dict lookups and comparisons on names match on identity.
+
+    Args:
+        aggregated_data (dict): A dictionary mapping username to a list of monster records.
+
+    Returns:
+        dict: aggregated_data itself.
+    """
+    intern = sys.intern
+    for monsters in aggregated_data.values():
+        for monster in monsters or ():
+            name = monster.get("nom")
+            if type(name) is str:
+                monster["nom"] = intern(name)
+    return aggregated_data
+
+@lru_cache(maxsize=4)
+def _load_user_monsters_cached(file_name, mtime_ns, size):
+    # Same as _load_json_cached, the names are interned once per decoded content.
+    return intern_monster_names(_load_json_cached(file_name, mtime_ns, size))
 
 def get_local_user_monsters(file_name=USER_MONSTERS_FILE):
     try:
-        with open(file_name, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data
+        stat = os.stat(file_name)
+        return _load_user_monsters_cached(file_name, stat.st_mtime_ns, stat.st_size)
     except FileNotFoundError:
         logging.error("File %s not found.", file_name)
     except json.JSONDecodeError:
         logging.error("Error decoding JSON from file %s.", file_name)
 
-def count_monster_quantities(data, filter_users=[], only_archi=True, proposed=False):
+@dataclass
+class MonsterTable:
     """
-    Reads the JSON file containing aggregated monster data for each user and computes the total quantity 
-    for each monster across all users.
+    The monster records of every player laid out in columns (one array per field
+    instead of one dict per record), so that aggregations are numpy reductions.
+
+    Record i is the monster names[name_ids[i]] of the player users[user_ids[i]];
+    records[i] is its original dict. Records without a name are left out.
+    """
+    users: list
+    names: list
+    records: list
+    user_ids: "numpy.ndarray"
+    name_ids: "numpy.ndarray"
+    quantities: "numpy.ndarray"
+    proposed: "numpy.ndarray"
+    archi: "numpy.ndarray"
+
+def build_monster_table(data):
+    """
+    Builds the MonsterTable of aggregated monster data, in a single pass over the records.
+
+    Args:
+        data (dict): A dictionary mapping username to a list of monster records.
+
+    Returns:
+        MonsterTable: The records of data in columns.
+    """
+    # Imported here: numpy is slow to import and only needed by the analysis commands.
+    import numpy as np
+
+    users = list(data)
+    name_columns = {}
+    records, user_ids, name_ids, quantities, proposed, archi = [], [], [], [], [], []
+    for user_id, user in enumerate(users):
+        for monster in data[user] or ():
+            name = monster.get("nom")
+            if not name:
+                continue
+            records.append(monster)
+            user_ids.append(user_id)
+            name_ids.append(name_columns.setdefault(name, len(name_columns)))
+            quantities.append(parse_quantity(monster.get("quantite")))
+            proposed.append(parse_quantity(monster.get("propose")))
+            # The API returns the type in lowercase, no need to normalize it.
+            archi.append(monster.get("type") == "archimonstre")
+
+    return MonsterTable(
+        users=users,
+        names=list(name_columns),
+        records=records,
+        user_ids=np.asarray(user_ids, dtype=np.intp),
+        name_ids=np.asarray(name_ids, dtype=np.intp),
+        quantities=np.asarray(quantities, dtype=np.int64),
+        proposed=np.asarray(proposed, dtype=np.int64),
+        archi=np.asarray(archi, dtype=bool),
+    )
+
+@dataclass
+class MonsterCounts:
+    """
+    Total quantity of each monster, as computed by analyze_monsters: the monster
+    names[i] was counted counts[i] times, records[i] is its last record.
+    """
+    names: list
+    records: list
+    counts: "numpy.ndarray"
+
+    @classmethod
+    def from_dict(cls, monster_counts):
+        """
+        Builds the counts from the dictionary returned by count_monster_quantities.
+        """
+        import numpy as np
+
+        return cls(
+            names=list(monster_counts),
+            records=[info["data"] for info in monster_counts.values()],
+            counts=np.fromiter((info["cnt"] for info in monster_counts.values()), dtype=np.int64,
+                               count=len(monster_counts)),
+        )
+
+    def to_dict(self):
+        """
+        Returns the counts as {"monster_name": {"cnt": count, "data": last_record}, ...}.
+        """
+        return {name: {"cnt": cnt, "data": record}
+                for name, cnt, record in zip(self.names, self.counts.tolist(), self.records)}
+
+def analyze_monsters(data, filter_users=[], only_archi=True, proposed=False):
+    """
+    Computes the total quantity of each monster across all users from the aggregated monster data.
     
     If only_archi is True, only monsters with "type" == "archimonstre" are counted.
     If proposed is True, only monsters propsed for trade are counted (and once per player)
     
     Args:
+        data (dict or MonsterTable): The aggregated monster data, mapping username to a list
+                                     of monster records, or its MonsterTable.
+        filter_users (list): If not empty, only the monsters of these users are counted.
         only_archi (bool): Whether to count only monsters of type "archimonstre". Default is True.
-        file_name (str): The name of the JSON file that contains the aggregated monster data.
+        proposed (bool): Whether to count the monsters proposed for trade instead of the quantities.
         
     Returns:
-        dict: A dictionary where the keys are monster names and the values are the total quantities.
+        MonsterCounts: The counted monsters, in order of first appearance, with their total
+                       quantity and their last record (as "data").
     """
-    counts = {}
-
-    # 'data' is expected to be a dictionary mapping username to a list of monster dictionaries.
-    for user, monsters in data.items():
-        if len(filter_users) != 0 and user not in filter_users:
-            continue
-        if not monsters:
-            continue
-        for monster in monsters:
-            # If filtering to only count "archimonstre", skip if the type does not match.
-            if only_archi and monster.get("type", "").lower() != "archimonstre":
-                continue
+    import numpy as np
+
+    table = data if isinstance(data, MonsterTable) else build_monster_table(data)
+
+    # Records to count.
+    selected = np.ones(len(table.records), dtype=bool)
+    if only_archi:
+        selected &= table.archi
+    if filter_users:
+        filter_users = set(filter_users)
+        user_mask = np.fromiter((user in filter_users for user in table.users), dtype=bool, count=len(table.users))
+        selected &= user_mask[table.user_ids]
+    rows = np.flatnonzero(selected)
+    name_ids = table.name_ids[rows]
+    weights = (table.proposed if proposed else table.quantities)[rows]
+
+    # Sum of the quantities of each monster in one call.
+    counts = np.bincount(name_ids, weights=weights, minlength=len(table.names)).astype(np.int64)
+
+    # Monsters in order of first appearance, each with its last record.
+    seen_ids, first_rows = np.unique(name_ids, return_index=True)
+    _, last_rows_reversed = np.unique(name_ids[::-1], return_index=True)
+    last_rows = len(name_ids) - 1 - last_rows_reversed
+    order = np.argsort(first_rows, kind="stable")
+    seen_ids, last_rows = seen_ids[order], last_rows[order]
+    return MonsterCounts(
+        names=[table.names[name_id] for name_id in seen_ids.tolist()],
+        records=[table.records[row] for row in rows[last_rows].tolist()],
+        counts=counts[seen_ids],
+    )
 
-            # Get the monster's name and quantity. We assume quantity defaults to 1 if not provided.
-            name = monster.get("nom")
-            if proposed:
-                quantite = int(monster.get("propose"))
-            else:
-                quantite = int(monster.get("quantite"))
-            if name:
-                if name not in counts:
-                    counts[name] = {}
-                counts[name]["cnt"] = counts[name].get("cnt", 0) + quantite
-                counts[name]["data"] = monster
+def count_monster_quantities(data, filter_users=[], only_archi=True, proposed=False):
+    """
+    Same as analyze_monsters, with the result as a dictionary.
 
-    return counts
+    Returns:
+        dict: A dictionary where the keys are monster names and the values are dictionaries with
+              the total quantity ("cnt") and the last record of the monster ("data").
+    """
+    return analyze_monsters(data, filter_users=filter_users, only_archi=only_archi,
+                            proposed=proposed).to_dict()
 
 def plot_monster_histogram(monster_counts):
     """
@@ -333,18 +725,22 @@ def plot_monster_histogram(monster_counts):
     ordered from left to right by increasing count.
 
     Args:
-        monster_counts (dict): A dictionary where keys are monster names
-                               and values are their total counts.
+        monster_counts (MonsterCounts or dict): The counts of analyze_monsters, or the
+                               dictionary of count_monster_quantities.
     """
-    # Sort the monster counts by value (lowest to highest)
-    sorted_items = sorted(monster_counts.items(), key=lambda item: item[1]["cnt"])
+    # Imported here: matplotlib is slow to import and only needed by this command.
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    if isinstance(monster_counts, dict):
+        monster_counts = MonsterCounts.from_dict(monster_counts)
 
-    # Unzip the sorted list of tuples into two tuples: names and counts.
-    names, counts = zip(*sorted_items) if sorted_items else ([], [])
+    # Sort the monster counts by value (lowest to highest)
+    order = np.argsort(monster_counts.counts, kind="stable")
 
     # Create a new figure for the chart.
     plt.figure()
-    plt.bar(names, [c["cnt"] for c in counts])
+    plt.bar([monster_counts.names[i] for i in order.tolist()], monster_counts.counts[order])
     plt.xlabel("Monster Kind")
     plt.ylabel("Count")
     plt.title("Histogram of Monster Quantities by Kind\n(Ordered from lowest to highest)")
@@ -358,6 +754,39 @@ def plot_monster_histogram(monster_counts):
     # Show the plot.
     plt.show()
 
+def select_extremes(counts, n, largest=False):
+    """
+    Returns the indices of the n lowest (or highest) values of an array, ordered by value.
+
+    The selection is done with np.partition (linear time), only the selected values are
+    sorted. The result is the same as with a stable sort of the whole array: the n first
+    items (lowest values), or the n last items in reverse order (highest values). Equal
+    values are therefore listed in the order of the array for the lowest values, and in
+    reverse order for the highest ones.
+
+    Args:
+        counts (numpy.ndarray): 1-D array of counts.
+        n (int): Number of indices to return (at most len(counts)).
+        largest (bool): Whether to select the highest values instead of the lowest.
+
+    Returns:
+        numpy.ndarray: The selected indices.
+    """
+    import numpy as np
+
+    if n <= 0:
+        return np.empty(0, dtype=np.intp)
+    if largest:
+        # n-th highest value: every value above it, and the last ties, are selected
+        kth = np.partition(counts, len(counts) - n)[len(counts) - n]
+        candidates = np.flatnonzero(counts >= kth)
+        order = np.argsort(counts[candidates], kind="stable")[::-1]
+    else:
+        kth = np.partition(counts, n - 1)[n - 1]
+        candidates = np.flatnonzero(counts <= kth)
+        order = np.argsort(counts[candidates], kind="stable")
+    return candidates[order[:n]]
+
 def print_monster_extremes(monster_counts, n=10, verbose=True):
     """
     Prints the n most rare and n most common monsters based on their total count.
@@ -369,61 +798,60 @@ def print_monster_extremes(monster_counts, n=10, verbose=True):
       }
     
     Args:
-        monster_counts (dict): Dictionary with monster names as keys and a dictionary
-                               containing "cnt" and "data" as values.
+        monster_counts (MonsterCounts or dict): The counts of analyze_monsters, or a dictionary
+                               with monster names as keys and a dictionary containing "cnt"
+                               and "data" as values.
         n (int): Number of extreme entries (rare and common) to print (default is 10).
     """
-    # Sort the items by the count value ("cnt"), in ascending order
-    sorted_items = sorted(monster_counts.items(), key=lambda item: item[1]["cnt"])
+    if isinstance(monster_counts, dict):
+        monster_counts = MonsterCounts.from_dict(monster_counts)
+    names, records, counts = monster_counts.names, monster_counts.records, monster_counts.counts.tolist()
 
     # Determine how many items we can display (if there are fewer than n monsters)
-    n = min(n, len(sorted_items))
-
-    # The n most rare monsters: the first n items (lowest counts)
-    rare_monsters = sorted_items[:n]
-
-    # The n most common monsters: the last n items (highest counts), reversed to show highest first
-    common_monsters = sorted_items[-n:][::-1]
-
-    display_monsters = rare_monsters + common_monsters
-    max_archi_width = max(len(m[0]) for m in display_monsters)
-    max_monstre_width = max(len(m[1]['data']['nom_normal']) for m in display_monsters)+16
-    max_zone_width = max(len(m[1]['data']['zone']) for m in display_monsters)
-    max_szone_width = max(len(m[1]['data']['souszone']) for m in display_monsters)
-    sszone = [m[1]['data']['zone'] + m[1]['data']['souszone'] for m in display_monsters]
-    max_szzone_width = max(len(s) for s in sszone) + 3
-
-    # Print results
-    print(f"Top {n} Most Rare Monsters:")
-    for i, (monster, info) in enumerate(rare_monsters):
-        sm = f"(sous-monstre: {info['data']['nom_normal']})"
-        szz = f"{info['data']['souszone']} ({info['data']['zone']})"
-        if verbose:
-            print(f"#{i+1:<2} {monster:<{max_archi_width}}: {info['cnt']:3} {sm:<{max_monstre_width}} - {szz:<{max_szzone_width}} - etape {info['data']['etape']}")
-        else:
-            print(f"#{i+1:<2} {monster:<{max_archi_width}} - {info['data']['souszone']} ({info['data']['zone']})")
-
-    print(f"\nTop {n} Most Common Monsters:")
-    for i, (monster, info) in enumerate(common_monsters):
-        sm = f"(sous-monstre: {info['data']['nom_normal']})"
-        szz = f"{info['data']['souszone']} ({info['data']['zone']})"
+    n = min(n, len(names))
+
+    # The n most rare monsters: lowest counts first (no need to sort every monster)
+    rare_monsters = select_extremes(monster_counts.counts, n).tolist()
+
+    # The n most common monsters: highest counts first
+    common_monsters = select_extremes(monster_counts.counts, n, largest=True).tolist()
+
+    # Column widths, computed in a single pass over the displayed monsters
+    max_archi_width = max_monstre_width = max_szzone_width = 0
+    for idx in rare_monsters + common_monsters:
+        monster, data = names[idx], records[idx]
+        max_archi_width = max(max_archi_width, len(monster))
+        max_monstre_width = max(max_monstre_width, len(data['nom_normal']))
+        max_szzone_width = max(max_szzone_width, len(data['zone']) + len(data['souszone']))
+    max_monstre_width += 16
+    max_szzone_width += 3
+
+    def format_line(i, idx):
+        monster, data = names[idx], records[idx]
         if verbose:
-            print(f"#{i+1:<2} {monster:<{max_archi_width}}: {info['cnt']:3} {sm:<{max_monstre_width}} - {szz:<{max_szzone_width}} - etape {info['data']['etape']}")
-        else:
-            print(f"#{i+1:<2} {monster:<{max_archi_width}} - {info['data']['souszone']} ({info['data']['zone']})")
+            sm = f"(sous-monstre: {data['nom_normal']})"
+            szz = f"{data['souszone']} ({data['zone']})"
+            return f"#{i+1:<2} {monster:<{max_archi_width}}: {counts[idx]:3} {sm:<{max_monstre_width}} - {szz:<{max_szzone_width}} - etape {data['etape']}"
+        return f"#{i+1:<2} {monster:<{max_archi_width}} - {data['souszone']} ({data['zone']})"
+
+    # Print results in a single write
+    lines = [f"Top {n} Most Rare Monsters:"]
+    lines.extend(format_line(i, idx) for i, idx in enumerate(rare_monsters))
+    lines.append(f"\nTop {n} Most Common Monsters:")
+    lines.extend(format_line(i, idx) for i, idx in enumerate(common_monsters))
+    sys.stdout.write("\n".join(lines) + "\n")
 
 def print_user_monster_list_data(player_monster_list, full_user_data):
-    def len_list(f):
-        l = []
-        for p, d in full_user_data.items():
-            if p in [p for p, _ in player_monster_list] and f in d:
-                l.append(len(d[f]))
-        return max(l)
-
-    max_metam_pseudo_width = max(len(p) for p, _ in player_monster_list)
-    max_monster_width = max(len(m) for _, m in player_monster_list)
-    max_pseudo_width = len_list('pseudo')
-    max_link_width = len_list('lien')
+    # Column widths, computed in a single pass over the listed players
+    max_metam_pseudo_width = max_monster_width = max_pseudo_width = max_link_width = 0
+    for p, m in player_monster_list:
+        max_metam_pseudo_width = max(max_metam_pseudo_width, len(p))
+        max_monster_width = max(max_monster_width, len(m))
+        d = full_user_data.get(p) or {}
+        if 'pseudo' in d:
+            max_pseudo_width = max(max_pseudo_width, len(d['pseudo']))
+        if 'lien' in d:
+            max_link_width = max(max_link_width, len(d['lien']))
     sl = {}
     for p, m in player_monster_list:
         if p in full_user_data and 'pseudo' in full_user_data[p]:
@@ -431,11 +859,114 @@ def print_user_monster_list_data(player_monster_list, full_user_data):
             sl[d['derniere_connexion']] = f"{m:{max_monster_width}} - {d['pseudo']:{max_pseudo_width}} (metamob: {p:{max_metam_pseudo_width}}) - {d['lien']:{max_link_width}} - Last loggin: {d['derniere_connexion']}"
         else:
             sl['2000-10-10 12:12:12'] = f"{m:{max_monster_width}} - metamob: {p} - no data"
-    sorted_keys = sorted(sl.keys(), key=lambda s: datetime.strptime(s, "%Y-%m-%d %H:%M:%S"))
-    for key in sorted_keys:
-        print(f"{sl[key]}")
+    # "YYYY-MM-DD HH:MM:SS" dates sort chronologically as plain strings.
+    sorted_keys = sorted(sl)
+    if sorted_keys:
+        sys.stdout.write("\n".join(sl[key] for key in sorted_keys) + "\n")
+
+def normalize_monster_name(name):
+    """
+    Returns the key used to compare monster names: Unicode normalized (so that
+    an accent typed as a combining character still matches) and case-folded.
+    """
+    return unicodedata.normalize("NFKC", name).casefold()
+
+def build_monster_index(aggregated_data):
+    """
+    Builds an inverted index of the monster records, so that a search only goes
+    through the distinct monster names instead of every record of every player.
+
+    Args:
+        aggregated_data (dict): A dictionary mapping username to a list of monster records.
 
-def find_players_proposing(monster_name, aggregated_data):
+    Returns:
+        dict: A dictionary mapping each normalized monster name (see normalize_monster_name)
+              to a list of (position, username, monster name, proposed, researched) tuples.
+              The position is the rank of the record in aggregated_data (players, then
+              records), so that matches can be listed in the order of the data.
+    """
+    index = defaultdict(list)
+    # Each distinct name is only normalized once.
+    keys = {}
+    position = 0
+    for username, monsters in aggregated_data.items():
+        for monster in monsters or ():
+            name = monster.get("nom", "")
+            key = keys.get(name)
+            if key is None:
+                key = keys[name] = normalize_monster_name(name)
+            index[key].append((position, username, name,
+                               monster.get("propose") in FLAG_SET_VALUES,
+                               monster.get("recherche") in FLAG_SET_VALUES))
+            position += 1
+    return dict(index)
+
+# (aggregated_data, index) of the last call to get_monster_index.
+_monster_index_cache = (None, None)
+
+def get_monster_index(aggregated_data):
+    """
+    Returns the index of build_monster_index for aggregated_data, reusing the
+    previous one when called again with the same object (changes made in place
+    to aggregated_data are therefore not seen).
+    """
+    global _monster_index_cache
+    cached_data, index = _monster_index_cache
+    if cached_data is not aggregated_data:
+        index = build_monster_index(aggregated_data)
+        _monster_index_cache = (aggregated_data, index)
+    return index
+
+def monster_index_file(monsters_file):
+    """
+    Returns the name of the file storing the index of a monsters file
+    ("monsters.json" -> "monsters.index.json").
+    """
+    return os.path.splitext(monsters_file)[0] + ".index.json"
+
+def monster_file_signature(monsters_file):
+    # Identifies the content of the monsters file an index was built from.
+    stat = os.stat(monsters_file)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+def store_monster_index(aggregated_data, monsters_file):
+    # Saved next to the monsters file (just written from aggregated_data), so the
+    # searches don't have to load and index it.
+    index_file = monster_index_file(monsters_file)
+    try:
+        write_json_file({"version": MONSTER_INDEX_VERSION,
+                         "source": monster_file_signature(monsters_file),
+                         "index": build_monster_index(aggregated_data)}, index_file)
+        logger.info("Monster index stored in %s", index_file)
+    except Exception as e:
+        logger.error("Error writing monster index to file: %s", e)
+
+def load_monster_index(monsters_file):
+    """
+    Loads the index stored by store_monster_index for a monsters file.
+
+    Args:
+        monsters_file (str): The monsters file the index was built from.
+
+    Returns:
+        dict: The index (see build_monster_index), or None if there is no index file,
+              if it has an older layout, or if it was not built from the current monsters
+              file (modification time and size recorded in the index file).
+    """
+    index_file = monster_index_file(monsters_file)
+    try:
+        stored = load_json_file(index_file)
+        if (stored.get("version") != MONSTER_INDEX_VERSION
+                or stored.get("source") != monster_file_signature(monsters_file)):
+            return None
+        return stored["index"]
+    except FileNotFoundError:
+        return None
+    except json.JSONDecodeError:
+        logger.error("Error decoding JSON from file %s.", index_file)
+        return None
+
+def find_players_proposing(monster_name, aggregated_data=None, index=None):
     """
     Searches for all players that are proposing (selling/trading) a given monster.
     
@@ -445,6 +976,8 @@ def find_players_proposing(monster_name, aggregated_data):
              Each monster record is expected to be a dictionary containing at least:
              - "nom": Name of the monster.
              - "propose": "1" if the player is offering the monster (or 1), "0" otherwise.
+        index (dict, optional): The index of aggregated_data (see build_monster_index),
+             used instead of aggregated_data when given.
     
     Returns:
         list: A list of dictionaries with keys:
@@ -452,16 +985,20 @@ def find_players_proposing(monster_name, aggregated_data):
               - "monster": The monster record matching the criteria.
     """
     result = []
-    for username, monsters in aggregated_data.items():
-        for monster in monsters:
-            # Compare monster names case-insensitively.
-            if monster_name.lower() in monster.get("nom", "").lower() and str(monster.get("propose", "0")) == "1":
-                #result.append({"username": username, "monster": monster})
-                result.append((username, monster.get("nom", "")))
-    return result
-
-
-def find_players_researching(monster_name, aggregated_data):
+    # Compare monster names case-insensitively.
+    needle = normalize_monster_name(monster_name)
+    if index is None:
+        index = get_monster_index(aggregated_data)
+    for key, records in index.items():
+        if needle in key:
+            result.extend((position, username, name) for position, username, name, proposed, _ in records
+                          if proposed)
+    # Matches in the order of the data (players, then records), not grouped by name.
+    result.sort()
+    return [(username, name) for _, username, name in result]
+
+
+def find_players_researching(monster_name, aggregated_data=None, index=None):
     """
     Searches for all players that are researching (looking to acquire) a given monster.
     
@@ -471,6 +1008,8 @@ def find_players_researching(monster_name, aggregated_data):
              Each monster record is expected to be a dictionary containing at least:
              - "nom": Name of the monster.
              - "recherche": "1" if the player is looking for the monster (or 1), "0" otherwise.
+        index (dict, optional): The index of aggregated_data (see build_monster_index),
+             used instead of aggregated_data when given.
     
     Returns:
         list: A list of dictionaries with keys:
@@ -478,13 +1017,27 @@ def find_players_researching(monster_name, aggregated_data):
               - "monster": The monster record matching the criteria.
     """
     result = []
-    for username, monsters in aggregated_data.items():
-        for monster in monsters:
-            #print(monster["nom"], monster_name, monster["recherche"])
-            if monster_name.lower() in monster.get("nom", "").lower() and str(monster.get("recherche", "0")) == "1":
-                #result.append({"username": username, "monster": monster})
-                result.append((username, monster.get("nom", "")))
-    return result
+    needle = normalize_monster_name(monster_name)
+    if index is None:
+        index = get_monster_index(aggregated_data)
+    for key, records in index.items():
+        if needle in key:
+            result.extend((position, username, name) for position, username, name, _, researched in records
+                          if researched)
+    # Matches in the order of the data (players, then records), not grouped by name.
+    result.sort()
+    return [(username, name) for _, username, name in result]
+
+def parse_quantity(value):
+    """
+    Returns a quantity of the API as an int (0 if missing or invalid).
+    """
+    if type(value) is int:
+        return value
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return 0
 
 def compare_monster_files(old_data, new_data, proposed=True):
     """
@@ -517,31 +1070,25 @@ def compare_monster_files(old_data, new_data, proposed=True):
         """
         if not monster_list:
             return {}
-        grouped = {}
         if use_proposed:
+            grouped = {}
             for m in monster_list:
                 name = m.get("nom")
                 if not name:
                     continue
-                # Set presence to 1 if any record shows proposed == "1"
-                flag = 1 if str(m.get("propose", "0")) == "1" else 0
-                if name not in grouped:
-                    grouped[name] = flag
-                else:
-                    # Once proposed, always mark as 1.
-                    if grouped[name] == 0 and flag == 1:
-                        grouped[name] = 1
+                # Set presence to 1 if any record shows proposed == "1".
+                # Once proposed, always mark as 1.
+                if m.get("propose") in FLAG_SET_VALUES:
+                    grouped[name] = 1
+                elif name not in grouped:
+                    grouped[name] = 0
             return grouped
         else:
+            grouped = Counter()
             for m in monster_list:
                 name = m.get("nom")
-                if not name:
-                    continue
-                try:
-                    qty = int(m.get("quantite", 0))
-                except (ValueError, TypeError):
-                    qty = 0
-                grouped[name] = grouped.get(name, 0) + qty
+                if name:
+                    grouped[name] += parse_quantity(m.get("quantite"))
             return grouped
 
     # Process each player in new_data.
@@ -553,6 +1100,10 @@ def compare_monster_files(old_data, new_data, proposed=True):
         # Get the old monsters list (if None or missing, treat as empty list).
         old_monsters = old_data.get(player) if old_data.get(player) is not None else []
 
+        # Most players did not change between two snapshots: nothing to report.
+        if new_monsters == old_monsters:
+            continue
+
         new_group = group_monsters(new_monsters, proposed)
         old_group = group_monsters(old_monsters, proposed)
 
@@ -614,267 +1165,386 @@ def detect_unbalanced_players(data, factor=3):
     Returns:
         list: A list of strings. Each string reports a player deemed unbalanced and explains why.
     """
-    # Build the full set of monster names across the dataset (ignoring records with "etape" == "14")
-    full_monster_set = set()
-    for player, monsters in data.items():
-        if not monsters:
-            continue  # Skip players with missing data.
-        for m in monsters:
-            if m.get("etape") == "14":
-                continue
-            name = m.get("nom")
-            if name:
-                full_monster_set.add(name)
-
-    results = []
-    # For each player, build a complete count per monster (default 0 if not present)
-    for player, monsters in data.items():
-        if not monsters:
-            # Skip players with missing or None data.
-            continue
-
-        # Initialize counts for every monster in the full set to 0.
-        player_counts = {mon: 0 for mon in full_monster_set}
-        for m in monsters:
-            if m.get("etape") == "34":
-                continue
+    # Imported here: numpy is slow to import and only needed by this analysis.
+    import numpy as np
+
+    # Single pass over the records of every player: flatten them into (row, column, quantity)
+    # triplets and flag the columns of the full set of monster names across the dataset
+    # (ignoring records with "etape" == "14").
+    players = [player for player, monsters in data.items() if monsters]
+    columns = {}
+    full_set_columns = set()
+    rows, cols, quantities = [], [], []
+    # Local aliases for the tight loop below.
+    add_row, add_col, add_quantity = rows.append, cols.append, quantities.append
+    for row, player in enumerate(players):
+        for m in data[player]:
             mon_name = m.get("nom")
             if not mon_name:
                 continue
-            try:
-                qty = int(m.get("quantite", 0))
-            except (ValueError, TypeError):
-                qty = 0
-            player_counts[mon_name] = player_counts.get(mon_name, 0) + qty
-
-        # Compute the average only over monsters with count > 0.
-        non_zero_counts = [count for count in player_counts.values() if count > 0]
-        avg = (sum(non_zero_counts) / len(non_zero_counts)) if non_zero_counts else 0
-
-        # Define "high" as any monster count greater than factor * avg.
-        high_monsters = [f"{mon} ({player_counts[mon]})"
-                         for mon, count in player_counts.items() if count > factor * avg]
-        # Missing monsters are those with a count of 0.
-        missing_monsters = [f"{mon} (0)" for mon, count in player_counts.items() if count == 0]
-
-        # Report the player if they have at least one high monster and at least one missing monster.
-        if high_monsters and missing_monsters:
-            msg = (f"Player '{player}' is unbalanced: high count for {', '.join(high_monsters)} "
-                   f"(average over owned monsters: {avg:.2f}, threshold: {factor}×average).")
-            results.append(msg)
+            col = columns.setdefault(mon_name, len(columns))
+            etape = m.get("etape")
+            if etape != "14":
+                full_set_columns.add(col)
+            if etape == "34":
+                continue
+            add_row(row)
+            add_col(col)
+            add_quantity(parse_quantity(m.get("quantite")))
+
+    # Players x monsters matrix of counts (0 if not present).
+    index = (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp))
+    counts = np.zeros((len(players), len(columns)), dtype=np.int64)
+    np.add.at(counts, index, quantities)
+    # A monster outside the full set is only part of the pool of the players owning it.
+    in_pool = np.zeros(counts.shape, dtype=bool)
+    in_pool[:, list(full_set_columns)] = True
+    in_pool[index] = True
+
+    # Compute the average only over monsters with count > 0.
+    non_zero = counts > 0
+    nb_non_zero = non_zero.sum(axis=1)
+    avg = np.divide(np.where(non_zero, counts, 0).sum(axis=1), nb_non_zero,
+                    out=np.zeros(len(players)), where=nb_non_zero > 0)
+
+    # Define "high" as any monster count greater than factor * avg.
+    high = in_pool & (counts > factor * avg[:, None])
+    # Missing monsters are those with a count of 0.
+    missing = in_pool & (counts == 0)
+
+    results = []
+    names = list(columns)
+    # Report the players having at least one high monster and at least one missing monster.
+    for row in np.flatnonzero(high.any(axis=1) & missing.any(axis=1)):
+        high_monsters = [f"{names[col]} ({counts[row, col]})" for col in np.flatnonzero(high[row])]
+        msg = (f"Player '{players[row]}' is unbalanced: high count for {', '.join(high_monsters)} "
+               f"(average over owned monsters: {avg[row]:.2f}, threshold: {factor}×average).")
+        results.append(msg)
     return results
 
-def update_user_data_from_api(users, output_file=USER_LIST_FILE_NAME):
+def get_user_data(username, api_cache=None):
+    """
+    Retrieves the data of a given user (pseudo) by calling the API.
+
+    The API endpoint used is: GET /utilisateurs/(:pseudo)
+    (e.g., "https://api.metamob.fr/utilisateurs/{username}")
+
+    Args:
+        username (str): The user's pseudo.
+        api_cache (dict): Optional cache of the API responses (see load_api_cache).
+
+    Returns:
+        dict: The JSON decoded user data, or None if the request fails.
+    """
+    session = get_api_session()
+    if session is None:
+        logger.error("No API key available. Aborting.")
+        return None
+
+    url = f"https://api.metamob.fr/utilisateurs/{username}"
+    try:
+        api_rate_limiter.wait()
+        response = session.get(url, headers=conditional_headers(api_cache, url))
+    except Exception as e:
+        logger.error("Error retrieving data for user '%s': %s", username, e)
+        return None
+
+    if response.status_code == 304 and api_cache and url in api_cache:
+        return api_cache[url]["body"]
+    elif response.status_code == 200:
+        try:
+            user_data = json_loads(response.content)
+            cache_response(api_cache, url, response, user_data)
+            return user_data
+        except json.JSONDecodeError:
+            logger.error("Failed to decode JSON for user '%s'.", username)
+            return None
+    else:
+        logger.error("API request failed for user '%s' (Status: %s). Response: %s",
+                     username, response.status_code, response.text)
+        return None
+
+def update_user_data_from_api(users, output_file=USER_LIST_FILE_NAME, pretty=False, workers=API_WORKERS):
     """
     For each user in the provided dictionary, perform an API GET request to retrieve
     their data and update the dictionary accordingly. Finally, write the updated dictionary
     to the output file.
     
-    The API endpoint used is: GET /utilisateurs/(:pseudo)
-    (e.g., "https://api.metamob.fr/utilisateurs/{username}")
+    The requests are issued concurrently by get_user_data (see get_monsters_for_users).
     
     Args:
         users (dict): A dictionary where each key is a username and its value is a dictionary
                       (initially empty) for storing user data.
         output_file (str): The filename where the updated users data will be saved.
                            Default value is set to USER_LIST_FILE_NAME.
+        pretty (bool): Whether to indent the JSON written to the output file.
+        workers (int): Number of concurrent API calls (default is API_WORKERS).
     """
-    api_key = load_api_key()
-    if not api_key:
+    session = get_api_session()
+    if session is None:
         logger.error("No API key available. Aborting.")
         return
 
-    base_url = "https://api.metamob.fr/utilisateurs"  # Adjust base URL if needed.
-    headers = {"HTTP-X-APIKEY": api_key}
-
     if isinstance(users, dict):
         users_data = users
     else:
         users_data = {}
 
-    # Iterate over each user in the provided dictionary.
+    # Fetch every user of the provided dictionary.
+    api_cache = load_api_cache()
     nb_users = len(users)
-    for i, username in enumerate(users):
-        url = f"{base_url}/{username}"
-        try:
-            response = requests.get(url, headers=headers)
-            time.sleep(REQUEST_DELAY)  # Respect the delay between API calls.
-        except Exception as e:
-            logger.error("Error retrieving data for user '%s': %s", username, e)
-            continue
-
-        if response.status_code == 200:
-            try:
-                user_data = response.json()
-                users_data[username] = user_data
-                logger.info("Updated data for user '%s' - %d/%d", username, i+1, nb_users)
-            except json.JSONDecodeError:
-                logger.error("Failed to decode JSON for user '%s'.", username)
-        else:
-            logger.error("API request failed for user '%s' (Status: %s). Response: %s",
-                         username, response.status_code, response.text)
+    for i, (username, user_data) in enumerate(_run_pool(get_user_data, users, workers, api_cache=api_cache)):
+        if user_data is not None:
+            users_data[username] = user_data
+            logger.info("Updated data for user '%s' - %d/%d", username, i+1, nb_users)
+    store_api_cache(api_cache)
 
     # Write the updated users dictionary to the output file.
     try:
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(users_data, f, indent=4, ensure_ascii=False)
+        write_json_file(users_data, output_file, pretty=pretty)
         logger.info("Updated user data written to '%s'.", output_file)
     except Exception as e:
         logger.error("Error writing updated user data to file '%s': %s", output_file, e)
 
 
-def main():
+@dataclass
+class LocalData:
+    """
+    Lazy access to the local data files: each file is loaded the first time its
+    attribute is used, then reused for the rest of the command.
+    """
+    users_file: str = USER_LIST_FILE_NAME
+    monsters_file: str = USER_MONSTERS_FILE
+
+    @cached_property
+    def users(self):
+        return get_local_users(file_name=self.users_file)
+
+    @cached_property
+    def monsters(self):
+        return get_local_user_monsters(file_name=self.monsters_file)
+
+    @cached_property
+    def monster_table(self):
+        return build_monster_table(self.monsters)
+
+    @cached_property
+    def monster_index(self):
+        # The stored index when it is up to date, otherwise built from the monsters file.
+        index = load_monster_index(self.monsters_file)
+        if index is None:
+            index = get_monster_index(self.monsters)
+        return index
+
+def _cmd_find_proposing(args, data):
+    playerslist = find_players_proposing(args.monster, index=data.monster_index)
+    logger.info("Players proposing {}:".format(args.monster))
+    print_user_monster_list_data(playerslist, data.users)
+
+def _cmd_find_researching(args, data):
+    playerslist = find_players_researching(args.monster, index=data.monster_index)
+    logger.info("Players searching {}:".format(args.monster))
+    print_user_monster_list_data(playerslist, data.users)
+
+def _cmd_scrap_users(args, data):
+    scrap_user_list(output_file=args.filename, pretty=args.pretty)
+
+def _cmd_refresh_users(args, data):
+    users = get_local_users(file_name=args.filename)
+    update_user_data_from_api(users, output_file=args.filename, pretty=args.pretty, workers=args.workers)
+
+def _cmd_refresh_monsters(args, data):
+    update_monsters_for_users(user_list=data.users, output_file=args.filename, pretty=args.pretty,
+                              workers=args.workers)
+
+def _cmd_hist(args, data):
+    all_counts = analyze_monsters(data.monster_table, proposed=args.only_proposed)
+    plot_monster_histogram(all_counts)
+
+def _cmd_stats(args, data):
+    all_counts = analyze_monsters(data.monster_table, proposed=args.only_proposed)
+    print_monster_extremes(all_counts, n=args.n, verbose=args.v)
+
+def _cmd_compare(args, data):
+    # The two files are independent: load the new one in a thread meanwhile.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(get_local_user_monsters, "test.json")
+        monsters = data.monsters
+        newmonsters = future.result()
+    compare_monster_files(monsters, newmonsters, proposed=args.only_proposed)
+
+def _cmd_test(args, data):
+    res = detect_unbalanced_players(data.monsters, factor=3)
+    for r in res:
+        print(r)
+
+def positive_int(value):
+    """
+    argparse type of the options expecting a strictly positive integer.
+    """
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer")
+    return number
+
+_MONSTER_ARGUMENT = (("monster",), {
+    "type": str,
+    "help": "Name of the monster to search for."
+})
+_PRETTY_ARGUMENT = (("--pretty",), {
+    "action": "store_true",
+    "help": "Indent the written JSON file (bigger and slower to write)"
+})
+_WORKERS_ARGUMENT = (("--workers", "-j"), {
+    "type": positive_int,
+    "default": API_WORKERS,
+    "help": "Number of concurrent API calls (the calls stay rate limited)"
+})
+_ONLY_PROPOSED_ARGUMENT = (("--only-proposed", "-p"), {
+    "action": "store_true",
+    "help": "Only use data of the monster proposed for trading"
+})
+
+# Name, help, handler and arguments (flags and add_argument keywords) of each command.
+# The handler is called with the parsed arguments and the LocalData to work on.
+SUBCOMMANDS = [
+    {
+        "name": "find_proposing",
+        "help": "Find players proposing the specified monster.",
+        "func": _cmd_find_proposing,
+        "args": [_MONSTER_ARGUMENT],
+    },
+    {
+        "name": "find_researching",
+        "help": "Find players researching the specified monster.",
+        "func": _cmd_find_researching,
+        "args": [_MONSTER_ARGUMENT],
+    },
+    {
+        "name": "scrap_users",
+        "help": "Scrap the user list from the website (without the api). The user list will be updated with those. Typically this will get the 200 most recent logged-in users.",
+        "func": _cmd_scrap_users,
+        "args": [
+            (("--filename", "-f"), {
+                "type": str,
+                "default": USER_LIST_FILE_NAME,
+                "help": "Filename where to store the data"
+            }),
+            _PRETTY_ARGUMENT,
+        ],
+    },
+    {
+        "name": "refresh_users",
+        "help": "Refresh user data of each cached users from the website.",
+        "func": _cmd_refresh_users,
+        "args": [
+            (("--filename", "-f"), {
+                "type": str,
+                "default": USER_LIST_FILE_NAME,
+                "help": "Filename to update"
+            }),
+            _PRETTY_ARGUMENT,
+            _WORKERS_ARGUMENT,
+        ],
+    },
+    {
+        "name": "refresh_monsters",
+        "help": "Refresh the monsters of each cached users from the website.",
+        "func": _cmd_refresh_monsters,
+        "args": [
+            (("--filename", "-f"), {
+                "type": str,
+                "default": USER_MONSTERS_FILE,
+                "help": "Filename where to store the data"
+            }),
+            _PRETTY_ARGUMENT,
+            _WORKERS_ARGUMENT,
+        ],
+    },
+    {
+        "name": "hist",
+        "help": "Plot a histogram with the frequency of the monsters.",
+        "func": _cmd_hist,
+        "args": [_ONLY_PROPOSED_ARGUMENT],
+    },
+    {
+        "name": "stats",
+        "help": "Display monsters stats.",
+        "func": _cmd_stats,
+        "args": [
+            _ONLY_PROPOSED_ARGUMENT,
+            (("-n",), {
+                "type": int,
+                "default": 10,
+                "help": "Number of monsters to display for top n"
+            }),
+            (("-v",), {
+                "action": "store_true",
+                "help": "Verbose output"
+            }),
+        ],
+    },
+    {
+        "name": "compare",
+        "help": "Compare 2 versions of the monsters json file.",
+        "func": _cmd_compare,
+        "args": [_ONLY_PROPOSED_ARGUMENT],
+    },
+    {
+        "name": "test",
+        "help": "test command",
+        "func": _cmd_test,
+        "args": [],
+    },
+]
+COMMAND_NAMES = frozenset(spec["name"] for spec in SUBCOMMANDS)
+
+@lru_cache(maxsize=None)
+def _build_parser(command=None):
+    """
+    Builds the argument parser. With a command, only the subparser of this command
+    is defined; otherwise (no command or an unknown one, the help...) the whole tree
+    is, as argparse lists every command in its messages. The parser is built once per
+    command.
+    """
     # Create the top-level parser.
     parser = argparse.ArgumentParser(
         description="Script to manage monster trading functionalities."
     )
 
     # Add subparsers for each command.
-    subparsers = parser.add_subparsers(dest="command", help="Command to execute", required=True)
+    subparsers = parser.add_subparsers(dest="command", help="Command to execute")
 
-    # Subparser for "find_proposing".
-    parser_find_prop = subparsers.add_parser(
-        "find_proposing",
-        help="Find players proposing the specified monster."
-    )
-    parser_find_prop.add_argument(
-        "monster",
-        type=str,
-        help="Name of the monster to search for."
-    )
-    parser_find_res = subparsers.add_parser(
-        "find_researching",
-        help="Find players researching the specified monster."
-    )
-    parser_find_res.add_argument(
-        "monster",
-        type=str,
-        help="Name of the monster to search for."
-    )
-    parser_scrap_users = subparsers.add_parser(
-        "scrap_users",
-        help="Scrap the user list from the website (without the api). The user list will be updated with those. Typically this will get the 200 most recent logged-in users."
-    )
-    parser_scrap_users.add_argument(
-        "--filename", "-f",
-        type=str,
-        default=USER_LIST_FILE_NAME,
-        help="Filename where to store the data"
-    )
-    parser_refresh_users = subparsers.add_parser(
-        "refresh_users",
-        help="Refresh user data of each cached users from the website."
-    )
-    parser_refresh_users.add_argument(
-        "--filename", "-f",
-        type=str,
-        default=USER_LIST_FILE_NAME,
-        help="Filename to update"
-    )
-    parser_refresh_monsters = subparsers.add_parser(
-        "refresh_monsters",
-        help="Refresh the monsters of each cached users from the website."
-    )
-    parser_refresh_monsters.add_argument(
-        "--filename", "-f",
-        type=str,
-        default=USER_MONSTERS_FILE,
-        help="Filename where to store the data"
-    )
-    parser_hist = subparsers.add_parser(
-        "hist",
-        help="Plot a histogram with the frequency of the monsters."
-    )
-    parser_hist.add_argument(
-        "--only-proposed", "-p",
-        action="store_true",
-        help="Only use data of the monster proposed for trading"
-    )
-    parser_stats = subparsers.add_parser(
-        "stats",
-        help="Display monsters stats."
-    )
-    parser_stats.add_argument(
-        "--only-proposed", "-p",
-        action="store_true",
-        help="Only use data of the monster proposed for trading"
-    )
-    parser_stats.add_argument(
-        "-n",
-        type=int,
-        default=10,
-        help="Number of monsters to display for top n"
-    )
-    parser_stats.add_argument(
-        "-v",
-        action="store_true",
-        help="Verbose output"
-    )
-    parser_cmp = subparsers.add_parser(
-        "compare",
-        help="Compare 2 versions of the monsters json file."
-    )
-    parser_cmp.add_argument(
-        "--only-proposed", "-p",
-        action="store_true",
-        help="Only use data of the monster proposed for trading"
-    )
-    subparsers.add_parser(
-        "test",
-        help="test command"
-    )
+    for spec in SUBCOMMANDS:
+        if command is not None and spec["name"] != command:
+            continue
+        subparser = subparsers.add_parser(spec["name"], help=spec["help"])
+        subparser.set_defaults(func=spec["func"])
+        for flags, kwargs in spec["args"]:
+            subparser.add_argument(*flags, **kwargs)
+    return parser
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # Known command: a parser for this command alone is enough.
+    command = argv[0] if argv and argv[0] in COMMAND_NAMES else None
+    parser = _build_parser(command)
 
     # Parse the arguments.
-    args = parser.parse_args()
-
-    # Dispatch to the appropriate function based on the subcommand.
-    if args.command == "find_proposing":
-        monsters = get_local_user_monsters()
-        playerslist = find_players_proposing(args.monster, monsters)
-        users = get_local_users()
-        logger.info("Players proposing {}:".format(args.monster))
-        print_user_monster_list_data(playerslist, users)
-        #print(find_players_proposing("Tronquette la Réduite", monsters))
-    elif args.command == "find_researching":
-        monsters = get_local_user_monsters()
-        #print(monsters)
-        playerslist = find_players_researching(args.monster, monsters)
-        users = get_local_users()
-        logger.info("Players searching {}:".format(args.monster))
-        print_user_monster_list_data(playerslist, users)
-        #print(find_players_researching("Tronquette la Réduite", monsters))
-    elif args.command == "scrap_users":
-        scrap_user_list(output_file=args.filename)
-    elif args.command == "refresh_users":
-        users = get_local_users(file_name=args.filename)
-        update_user_data_from_api(users, output_file=args.filename)
-    elif args.command == "refresh_monsters":
-        update_monsters_for_users(output_file=args.filename)
-        #update_monsters_for_users(user_list=["Kerman"])
-    elif args.command == "hist":
-        monsters = get_local_user_monsters()
-        all_counts = count_monster_quantities(monsters, proposed=args.only_proposed)
-        plot_monster_histogram(all_counts)
-    elif args.command == "stats":
-        monsters = get_local_user_monsters()
-        all_counts = count_monster_quantities(monsters, proposed=args.only_proposed)
-        print_monster_extremes(all_counts, n=args.n, verbose=args.v)
-    elif args.command == "compare":
-        monsters = get_local_user_monsters()
-        newmonsters = get_local_user_monsters("test.json")
-        compare_monster_files(monsters, newmonsters, proposed=args.only_proposed)
-    elif args.command == "test":
-        monsters = get_local_user_monsters()
-        res = detect_unbalanced_players(monsters, factor=3)
-        for r in res:
-            print(r)
-    else:
-        # This should never happen because 'required=True' forces a subcommand.
+    args = parser.parse_args(argv)
+
+    # No command: show the help and fail like argparse does on a usage error.
+    if args.command is None:
         parser.print_help()
+        return 2
+    # Run the handler of the subcommand.
+    args.func(args, LocalData())
 
 # Example usage:
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
 
 # ignore player with full sets
 # printing of a user: portfolio of monster, maybe sorted from most to least, ignoring the 0